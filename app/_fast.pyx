@@ -0,0 +1,37 @@
+# cython: language_level=3
+# app/_fast.pyx
+"""
+Optional compiled kernels for app.workflows.summarization.
+
+Build in place (requires Cython and a C compiler):
+
+    cythonize -i app/_fast.pyx
+
+When the extension is not built, summarization falls back to the pure-Python
+implementation, which produces identical results.
+"""
+
+
+cpdef list chunk_and_summarize(list words, Py_ssize_t chunk_size, Py_ssize_t summary_words):
+    """
+    Split `words` into chunks of `chunk_size` words and return the first
+    `summary_words` words of each chunk, joined with single spaces.
+    """
+    cdef Py_ssize_t n = len(words)
+    cdef Py_ssize_t keep = min(chunk_size, summary_words)
+    cdef Py_ssize_t i = 0
+    cdef str sep = " "
+    cdef list out = []
+
+    # same edge cases as split_text: no words gives no chunks, otherwise range(0, n, chunk_size)
+    if n == 0:
+        return out
+    if chunk_size == 0:
+        raise ValueError("chunk_size must not be zero")
+    if chunk_size < 0:
+        return out
+
+    while i < n:
+        out.append(sep.join(words[i:i + keep]))
+        i += chunk_size
+    return out
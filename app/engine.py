@@ -1,36 +1,570 @@
 # app/engine.py
 from __future__ import annotations
 
-from typing import Any, Dict, Optional, Callable
+from typing import Any, Dict, List, Literal, Optional, Callable, Sequence, Set, Tuple
+from collections import OrderedDict, deque, namedtuple
+from dataclasses import dataclass, field
 from datetime import datetime
+from array import array
+import asyncio
+import inspect
 import logging
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
 
+import psutil
+from immutables import Map
 from pydantic import ValidationError
 
 from app import model
-from app.model import GraphCreateRequest, Graph, Run, GraphRunResponse, RunStateResponse
+from app.model import (
+    GraphCreateRequest, Graph, Run, GraphRunResponse, RunStateResponse,
+    StateMap, StateUpdate, NodeName, RunId, RunPriority,
+)
 from app import registry
 
 logger = logging.getLogger(__name__)
 
+# Reducer used to combine the state updates of parallel branches: (merged_so_far, branch_update) -> merged
+Reducer = Callable[[StateUpdate, StateUpdate], StateUpdate]
+
 
 class EngineError(Exception):
     pass
 
 
+class EngineBusyError(EngineError):
+    """Raised when a run is refused because the server is under memory pressure."""
+    pass
+
+
+# -------------------------
+# Compiled graph plan
+# -------------------------
+LINEAR = 0
+CONDITIONAL = 1
+
+# Dispatch record for one node of a compiled graph (graph._plan[idx]).
+# Edge targets are plan indices: an int (next node), a tuple of ints (parallel fan-out)
+# or None (stop). `next` is the linear target, or the "default" target of a CONDITIONAL node;
+# `cond_keys` / `cond_targets` are the conditional map as parallel tuples.
+CompiledNode = namedtuple("CompiledNode", "name fn kind next cond_keys cond_targets")
+
+# Run.execution_log stores plan indices in an array('H')
+_MAX_PLAN_NODES = 0xFFFF
+# entries preallocated for run_graph's log (min(max_iterations, this)); longer runs append past it
+_LOG_PREALLOC = 1024
+
+
+def _compile_graph(graph: Graph, node_registry: Dict[str, Callable]) -> None:
+    """
+    Precompute the dispatch plan of a graph: a list of CompiledNode indexed by an
+    integer node id, with node functions and edge targets resolved up front.
+    Stores it on graph._plan / graph._name_to_idx.
+    """
+    names: Dict[NodeName, None] = dict.fromkeys(graph.nodes)
+    targets = list(graph.edges.values())
+    for cond_map in graph.conditional_edges.values():
+        targets.extend(cond_map.values())
+    for target in targets:
+        names.update(dict.fromkeys(_as_node_list(target)))
+
+    missing = [n for n in names if n not in node_registry]
+    if missing:
+        raise EngineError(f"Edge targets not found in registry: {missing}")
+    if len(names) > _MAX_PLAN_NODES:
+        raise EngineError(f"Graph has {len(names)} nodes; at most {_MAX_PLAN_NODES} are supported")
+
+    name_to_idx = {n: i for i, n in enumerate(names)}
+
+    def resolve(target: Any) -> Any:
+        if target is None:
+            return None
+        if isinstance(target, str):
+            return name_to_idx[target]
+        return tuple(name_to_idx[n] for n in target)
+
+    plan: List[CompiledNode] = []
+    for name in names:
+        name = sys.intern(name)
+        fn = node_registry[name]
+        cond_map = graph.conditional_edges.get(name)
+        if cond_map is not None:
+            plan.append(CompiledNode(
+                name, fn, CONDITIONAL, resolve(cond_map.get("default")),
+                tuple(cond_map), tuple(resolve(t) for t in cond_map.values()),
+            ))
+        else:
+            plan.append(CompiledNode(name, fn, LINEAR, resolve(graph.edges.get(name)), (), ()))
+
+    graph._plan = plan
+    graph._name_to_idx = name_to_idx
+    try:
+        _generate_driver(graph)
+    except Exception as e:
+        # the driver is only an optimization; the executors fall back to their loops
+        logger.warning("No driver generated for graph %s: %s", graph.id, e)
+
+
+# Limits for generated drivers: longest path (nesting depth) and total node blocks emitted
+_DRIVER_MAX_DEPTH = 32
+_DRIVER_MAX_BLOCKS = 256
+
+
+def _generate_driver(graph: Graph) -> None:
+    """
+    Generate a straight-line driver for a small acyclic graph without parallel fan-out
+    or async nodes. Every path from the entry node becomes nested Python: node calls are
+    inlined in order and each conditional node becomes an if/elif on its resolved target,
+    so run_graph skips the dispatch loop and _execute_async runs the whole graph in one
+    worker thread. The driver appends to the execution log and
+    updates the state exactly like the loop. Graphs it does not cover keep _driver = None.
+    """
+    plan = graph._plan
+    entry = graph._name_to_idx[graph.entry_node]
+
+    def targets(cn: CompiledNode) -> List[Any]:
+        # distinct possible targets, in edge order (None = stop)
+        return list(dict.fromkeys((cn.next,) + cn.cond_targets))
+
+    # longest path (in nodes) from each reachable node; None while on the DFS stack
+    depth: Dict[int, Optional[int]] = {}
+
+    def longest(idx: int, level: int) -> Optional[int]:
+        # None: cycle, fan-out, async node, or a path longer than _DRIVER_MAX_DEPTH; `level`
+        # bounds the recursion, so long chains give up early instead of walking to the end
+        if level > _DRIVER_MAX_DEPTH:
+            return None
+        if idx in depth:
+            return depth[idx]  # None here means a cycle
+        if inspect.iscoroutinefunction(plan[idx].fn):
+            return None
+        depth[idx] = None
+        best = 0
+        for t in targets(plan[idx]):
+            if type(t) is tuple:
+                return None
+            if t is not None:
+                d = longest(t, level + 1)
+                if d is None:
+                    return None
+                best = max(best, d)
+        depth[idx] = best + 1
+        return best + 1
+
+    driver_depth = longest(entry, 1)
+    if driver_depth is None or driver_depth > _DRIVER_MAX_DEPTH:
+        return
+
+    lines = ["def _driver(run):", "    log = run.execution_log"]
+    blocks = 0
+
+    def emit(idx: int, indent: str) -> None:
+        # every path is expanded, so conditional fan-out grows the code exponentially;
+        # stop as soon as the limit is passed
+        nonlocal blocks
+        blocks += 1
+        if blocks > _DRIVER_MAX_BLOCKS:
+            return
+        cn = plan[idx]
+        lines.extend([
+            f"{indent}log.append({idx})",
+            f"{indent}result = fn_{idx}(run.state)",
+            f"{indent}if isinstance(result, dict):",
+            f"{indent}    run.state = run.state.update(result)",
+            f"{indent}elif result is not None:",
+            f"{indent}    run.state = _apply_sync_result(run.state, result, {cn.name!r})",
+        ])
+        if cn.kind == LINEAR:
+            if cn.next is not None:
+                emit(cn.next, indent)
+            return
+        lines.append(f"{indent}target = _conditional_target(cn_{idx}, run.state)")
+        keyword = "if"
+        for t in targets(cn):
+            if t is None:
+                continue
+            lines.append(f"{indent}{keyword} target == {t}:")
+            emit(t, indent + "    ")
+            keyword = "elif"
+
+    emit(entry, "    ")
+    if blocks > _DRIVER_MAX_BLOCKS:
+        return
+
+    namespace: Dict[str, Any] = {
+        "_apply_sync_result": _apply_sync_result,
+        "_conditional_target": _conditional_target,
+    }
+    for idx, cn in enumerate(plan):
+        namespace[f"fn_{idx}"] = cn.fn
+        namespace[f"cn_{idx}"] = cn
+    exec(compile("\n".join(lines), f"<graph {graph.id}>", "exec"), namespace)
+    graph._driver = namespace["_driver"]
+    graph._driver_depth = driver_depth
+
+
+# -------------------------
+# Control-flow helpers
+# -------------------------
+# state[node_name] -> conditional_edges key, dispatched on the exact type of the value;
+# booleans map to "true"/"false", everything else (str/int/...) goes through str()
+_COND_KEY: Dict[type, Callable[[Any], str]] = {
+    bool: lambda v: "true" if v else "false",
+}
+
+
+def _default_or_error(cn: CompiledNode) -> str:
+    # no decision value set by node; fallback: try "default" key if present else error
+    if "default" in cn.cond_keys:
+        return "default"
+    raise EngineError(
+        f"Conditional node '{cn.name}' did not set state['{cn.name}']; "
+        "cannot decide next node"
+    )
+
+
+def _conditional_target(cn: CompiledNode, state: StateMap) -> Any:
+    """
+    Resolve the target of a CONDITIONAL node from the value it left in state[node_name].
+    """
+    # engine expects the node to set state[node_name] to something (str/bool/int)
+    cond_value = state.get(cn.name, None)
+    key = _COND_KEY.get(type(cond_value), str)(cond_value) if cond_value is not None else _default_or_error(cn)
+
+    # small maps: a tuple scan beats hashing into a dict
+    keys = cn.cond_keys
+    target = cn.cond_targets[keys.index(key)] if key in keys else None
+
+    # if key not present (or explicitly mapped to null) but default provided, use default;
+    # cn.next is None when there is no default, so we stop
+    if target is None:
+        target = cn.next
+    return target
+
+
+def _next_index(cn: CompiledNode, state: StateMap) -> Any:
+    # linear edge, or conditional_edges decided by the state the node left behind
+    if cn.kind == LINEAR:
+        return cn.next
+    return _conditional_target(cn, state)
+
+
+def _public_state(state: StateMap) -> StateMap:
+    # keys registered as node-private caches (registry.register_private_keys, e.g. cached
+    # tokenizations): dropped when a run finishes and never returned to clients
+    private = [k for k in registry.PRIVATE_STATE_KEYS if k in state]
+    if not private:
+        return state
+    mutation = state.mutate()
+    for k in private:
+        del mutation[k]
+    return mutation.finish()
+
+
+def _log_names(graph: Graph, log: Sequence[int]) -> List[NodeName]:
+    # execution_log holds plan indices; node names are only materialized for responses
+    plan = graph._plan
+    return [plan[i].name for i in log]
+
+
+def _finish_run(run: Run, error: Optional[Exception] = None) -> None:
+    # terminal bookkeeping shared by every executor
+    if error is None:
+        run.status = "completed"
+    else:
+        run.status = "failed"
+        run.error = str(error)
+    run.state = _public_state(run.state)
+    run.finished_at = time.monotonic()
+
+
+def _as_node_list(target: Any) -> List[Any]:
+    # normalize an edge target (name or plan index, list/tuple for fan-out, or None)
+    if target is None:
+        return []
+    if isinstance(target, (str, int)):
+        return [target]
+    return list(target)
+
+
+class _Reachability:
+    """
+    Node indices reachable from each node of a compiled plan (every conditional
+    target is considered possible). Computed lazily, per start node, and memoized:
+    only nodes that share a frontier with other nodes are ever looked up, so graphs
+    without fan-out never pay for it.
+    """
+    __slots__ = ("_plan", "_sets")
+
+    def __init__(self, plan: List[CompiledNode]):
+        self._plan = plan
+        self._sets: Dict[int, Set[int]] = {}
+
+    def _successors(self, idx: int) -> List[int]:
+        cn = self._plan[idx]
+        targets = _as_node_list(cn.next)
+        for target in cn.cond_targets:
+            targets.extend(_as_node_list(target))
+        return targets
+
+    def __getitem__(self, start: int) -> Set[int]:
+        seen = self._sets.get(start)
+        if seen is None:
+            seen = set()
+            stack = self._successors(start)
+            while stack:
+                n = stack.pop()
+                if n in seen:
+                    continue
+                seen.add(n)
+                stack.extend(self._successors(n))
+            self._sets[start] = seen
+        return seen
+
+
+def _split_frontier(frontier: List[int], reach: _Reachability) -> Tuple[List[int], List[int]]:
+    """
+    Split the frontier into nodes that can run now and join nodes that must wait.
+    A node waits while another active branch can still reach it, so branches of
+    different lengths reconverge before the join node runs (once).
+    """
+    if len(frontier) == 1:
+        return frontier, []
+    ready: List[int] = []
+    deferred: List[int] = []
+    for n in frontier:
+        if any(m != n and n in reach[m] for m in frontier):
+            deferred.append(n)
+        else:
+            ready.append(n)
+    if not ready:
+        # every node waits on another (branches inside a cycle): run them all rather than deadlock
+        return frontier, []
+    return ready, deferred
+
+
+def merge_updates(merged: StateUpdate, update: StateUpdate) -> StateUpdate:
+    """
+    Default reducer for parallel branches.
+    Lists written by more than one branch are concatenated (e.g. chunk_summaries);
+    any other value is last-writer-wins in branch order.
+    """
+    for key, value in update.items():
+        current = merged.get(key)
+        if isinstance(current, list) and isinstance(value, list):
+            merged[key] = current + value
+        else:
+            merged[key] = value
+    return merged
+
+
+def _apply_result(state: StateMap, result: Any, node: NodeName) -> StateMap:
+    """
+    Apply what a node returned to the state: a dict of updated keys (merged with
+    structural sharing), a whole new Map (replaces the state) or None (no change).
+    """
+    if isinstance(result, dict):
+        return state.update(result)
+    if isinstance(result, Map):
+        return result
+    if result is None:
+        return state
+    raise EngineError(
+        f"Node '{node}' returned {type(result).__name__}; expected a dict of updates, an immutables.Map or None"
+    )
+
+
+def _apply_sync_result(state: StateMap, result: Any, node: NodeName) -> StateMap:
+    # non-dict result of a node run outside the event loop; async nodes can't be awaited there
+    if inspect.isawaitable(result):
+        if inspect.iscoroutine(result):
+            result.close()  # never awaited; close it to avoid a RuntimeWarning
+        raise EngineError(f"Node '{node}' is async; use run_graph_async")
+    return _apply_result(state, result, node)
+
+
+def _branch_update(base: StateMap, result: Any, node: NodeName) -> StateUpdate:
+    # the keys a parallel branch changed; a returned Map is diffed against the state the branch saw
+    if isinstance(result, Map):
+        return {k: v for k, v in result.items() if k not in base or base[k] is not v}
+    return dict(_apply_result(Map(), result, node))
+
+
+def _join_branches(base: StateMap, updates: List[StateUpdate], reducer: Reducer) -> StateMap:
+    merged: StateUpdate = {}
+    for update in updates:
+        merged = reducer(merged, update)
+    return base.update(merged)
+
+
+async def _call_node(node_fn: Callable, state: StateMap) -> Any:
+    # nodes may be plain functions or `async def` coroutines; plain (CPU-bound) nodes run
+    # in a thread so they never block the event loop. The state is immutable, so sharing
+    # it with the thread is safe.
+    if inspect.iscoroutinefunction(node_fn):
+        return await node_fn(state)
+    result = await asyncio.to_thread(node_fn, state)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+@dataclass
+class _RunTask:
+    """
+    Scheduling bookkeeping for a run driven by the worker pool.
+    Only the dispatcher reads or writes it.
+    """
+    graph: Graph
+    max_iterations: int
+    iter_count: int = 0
+    ready: List[int] = field(default_factory=list)      # plan indices of the layer in flight
+    deferred: List[int] = field(default_factory=list)   # join nodes waiting for other branches
+    base: StateMap = field(default_factory=Map)         # state the layer started from
+    results: List[Any] = field(default_factory=list)    # what each node of the layer returned
+    pending: int = 0
+
+
+# -------------------------
+# Memory pressure
+# -------------------------
+MemoryLevel = Literal["normal", "warning", "critical"]
+
+# execution_log entries kept at each end when trimming under critical pressure
+_LOG_KEEP = 100
+
+
+class _OnDisk:
+    """Placeholder for a run.state spilled to a pickle file under memory pressure."""
+    __slots__ = ("path",)
+
+    def __init__(self, path: str):
+        self.path = path
+
+
+def _remove_spill_file(state: _OnDisk) -> None:
+    try:
+        os.remove(state.path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_spill_files(items: List[Tuple[StateMap, str]]) -> List[bool]:
+    # runs in a worker thread: pickle each (immutable) state to its path; True where written
+    written = []
+    for state, path in items:
+        try:
+            with open(path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            written.append(True)
+        except Exception as e:
+            logger.warning("Could not spill state to %s: %s", path, e)
+            # don't leave a partial pickle behind
+            _remove_spill_file(_OnDisk(path))
+            written.append(False)
+    return written
+
+
+def _load_spill_file(path: str) -> StateMap:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class _MemoryMonitor:
+    """
+    Polls the process RSS from a daemon thread and classifies it as
+    normal / warning / critical. While not normal, calls on_pressure(level)
+    after every poll (from the monitor thread).
+    """
+
+    def __init__(
+        self,
+        warning_bytes: int,
+        critical_bytes: int,
+        on_pressure: Callable[[MemoryLevel], None],
+        interval: float = 1.0,
+    ):
+        self.warning_bytes = warning_bytes
+        self.critical_bytes = critical_bytes
+        self.on_pressure = on_pressure
+        self.interval = interval
+        self.level: MemoryLevel = "normal"
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll, name="memory-monitor", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _poll(self) -> None:
+        while True:
+            rss = self._process.memory_info().rss
+            if rss >= self.critical_bytes:
+                self.level = "critical"
+            elif rss >= self.warning_bytes:
+                self.level = "warning"
+            else:
+                self.level = "normal"
+
+            if self.level != "normal":
+                try:
+                    self.on_pressure(self.level)
+                except Exception:
+                    logger.exception("Memory pressure handler failed")
+
+            if self._stop.wait(self.interval):
+                return
+
+
 class WorkflowEngine:
     """
     Minimal in-memory workflow engine.
     - stores graphs in self.graphs (graph_id -> Graph)
-    - stores runs in self.runs (run_id -> Run)
+    - stores runs in self.runs (run_id -> Run), an LRU capped at max_runs; evicted
+      finished runs are recycled for new runs
+    - under memory pressure spills the state of finished runs to disk (start_memory_monitor())
     - executes graphs synchronously via run_graph()
+    - executes graphs with concurrent parallel branches via run_graph_async()
+    - executes submitted runs in the background via a worker pool (submit_run()):
+      the engine acts as dispatcher, workers only execute nodes
     """
 
-    def __init__(self, node_registry: Optional[Dict[str, Callable]] = None):
+    def __init__(self, node_registry: Optional[Dict[str, Callable]] = None, max_runs: int = 10_000):
         # allow injecting a registry (useful for tests); default to app.registry.NODE_REGISTRY
         self.node_registry = node_registry if node_registry is not None else registry.NODE_REGISTRY
         self.graphs: Dict[str, Graph] = {}
-        self.runs: Dict[str, Run] = {}
+        # least recently used first; only finished runs are evicted, into _run_pool for reuse
+        self.runs: OrderedDict[str, Run] = OrderedDict()
+        self.max_runs = max_runs
+        self._run_pool: deque = deque(maxlen=1024)
+
+        # memory pressure (see start_memory_monitor): finished runs older than spill_after
+        # seconds have their state pickled into spill_dir, a private directory
+        # (tempfile.mkdtemp, mode 0700) created on the first spill
+        self.spill_dir: Optional[str] = None
+        self.spill_after = 60.0
+        self._memory_monitor: Optional[_MemoryMonitor] = None
+        self._relief: Optional[asyncio.Task] = None
+        # graph_id -> plan index -> indices reachable from it (used to find join points of parallel branches)
+        self._reachability: Dict[str, _Reachability] = {}
+
+        # worker pool (see start_workers); created inside the running event loop
+        self.reducer: Reducer = merge_updates
+        self._work_queue: Optional[asyncio.Queue] = None    # (run_id, slot, CompiledNode, state) work items
+        self._completions: Optional[asyncio.Queue] = None   # (run_id, slot, result, error) messages
+        self._tasks: List[asyncio.Task] = []
+        self._waiters: Set[asyncio.Future] = set()          # async nodes handed off by workers
+        self._active: Dict[RunId, _RunTask] = {}
 
     # -------------------------
     # Graph management
@@ -50,7 +584,8 @@ class WorkflowEngine:
         graph_obj = Graph(
             name=payload.name,
             entry_node=payload.entry_node,
-            nodes=payload.nodes,
+            # interned: the plan, logs and responses all share one string per node name
+            nodes=[sys.intern(n) for n in payload.nodes],
             edges=payload.edges,
             conditional_edges=conditional_edges,
         )
@@ -59,7 +594,11 @@ class WorkflowEngine:
         if graph_obj.entry_node not in graph_obj.nodes:
             raise EngineError(f"entry_node '{graph_obj.entry_node}' is not listed in nodes")
 
+        # resolve node functions and edges once, instead of on every step of every run
+        _compile_graph(graph_obj, self.node_registry)
+
         self.graphs[graph_obj.id] = graph_obj
+        self._reachability[graph_obj.id] = _Reachability(graph_obj._plan)
         logger.info("Graph created: %s", graph_obj.id)
         return graph_obj
 
@@ -72,115 +611,565 @@ class WorkflowEngine:
     # -------------------------
     # Run management / executor
     # -------------------------
-    def run_graph(self, graph_id: str, initial_state: Dict[str, Any], max_iterations: int = 100) -> GraphRunResponse:
+    def run_graph(
+        self,
+        graph_id: str,
+        initial_state: Dict[str, Any],
+        max_iterations: int = 100,
+        priority: RunPriority = "normal",
+    ) -> GraphRunResponse:
         """
         Run the graph synchronously from its entry_node using initial_state.
         Returns a GraphRunResponse with final state and execution log.
+        Graphs with parallel branches or async nodes must use run_graph_async().
+        Raises EngineBusyError if `priority` is not admitted at the current memory level.
         """
 
         graph = self.get_graph(graph_id)
+        self._admit(priority)
 
         # create a Run object and store
-        run = Run(graph_id=graph.id, state=initial_state.copy(), status="running", execution_log=[])
-        self.runs[run.id] = run
+        run = self._new_run(graph.id, initial_state)
 
-        current_node = graph.entry_node
+        plan = graph._plan
+        idx = graph._name_to_idx[graph.entry_node]
         iter_count = 0
+        log = None
 
         try:
-            while current_node is not None:
+            if graph._driver is not None and graph._driver_depth <= max_iterations:
+                # generated straight-line code for an acyclic graph; no path exceeds max_iterations
+                graph._driver(run)
+                idx = None
+            else:
+                # written by index below instead of growing append by append; trimmed to iter_count at the end
+                log = run.execution_log = array("H", [0]) * min(max(max_iterations, 0), _LOG_PREALLOC)
+
+            while idx is not None:
                 iter_count += 1
                 if iter_count > max_iterations:
                     raise EngineError(f"Max iterations ({max_iterations}) exceeded; possible infinite loop")
 
-                run.execution_log.append(current_node)
+                cn = plan[idx]
+                try:
+                    log[iter_count - 1] = idx
+                except IndexError:
+                    log.append(idx)
 
-                # fetch node function
-                node_fn = self.node_registry.get(current_node)
-                if node_fn is None:
-                    raise EngineError(f"Node function not found in registry: {current_node}")
-
-                # Call node function. Expectation: node modifies state in-place or returns a state dict.
-                # Support either pattern: if node returns a dict, we replace run.state; else assume it mutated run.state.
-                result = node_fn(run.state)
+                # Call node function. Nodes receive the immutable state and return a dict of the
+                # keys they changed (merged with structural sharing), a whole new Map, or None.
+                result = cn.fn(run.state)
                 if isinstance(result, dict):
-                    run.state = result
-
-                # Determine next node
-                # 1) If current node is in conditional_edges, use value in state keyed by node name
-                if current_node in graph.conditional_edges:
-                    cond_map = graph.conditional_edges[current_node]
-                    # engine expects the node to set state[current_node] to something (str/bool/int)
-                    cond_value = run.state.get(current_node, None)
-
-                    # normalize booleans to "true"/"false" strings for key lookup
-                    if isinstance(cond_value, bool):
-                        key = "true" if cond_value else "false"
-                    elif cond_value is None:
-                        # no decision value set by node; fallback: try "default" key if present else error
-                        if "default" in cond_map:
-                            key = "default"
-                        else:
-                            raise EngineError(
-                                f"Conditional node '{current_node}' did not set state['{current_node}']; "
-                                "cannot decide next node"
-                            )
-                    else:
-                        key = str(cond_value)
-
-                    next_node = cond_map.get(key)
-                    # if key not present but default provided, use default
-                    if next_node is None and "default" in cond_map:
-                        next_node = cond_map.get("default")
-
-                    # if still None and key explicitly mapped to null, we stop (next_node None)
-                    current_node = next_node
-                    continue
+                    run.state = run.state.update(result)
+                elif result is not None:
+                    run.state = _apply_sync_result(run.state, result, cn.name)
 
-                # 2) Otherwise use linear edges mapping
-                next_node = graph.edges.get(current_node)
-                # If edges mapping doesn't contain current_node => stop after current node
-                current_node = next_node
+                # Determine next node: linear edge, or conditional_edges keyed by state[node_name]
+                idx = cn.next if cn.kind == LINEAR else _conditional_target(cn, run.state)
+                if type(idx) is tuple:
+                    raise EngineError(
+                        f"Node '{cn.name}' fans out to parallel branches "
+                        f"{[plan[i].name for i in idx]}; use run_graph_async"
+                    )
 
             # finished
-            run.status = "completed"
+            if log is not None:
+                del log[iter_count:]
+            _finish_run(run)
             logger.info("Run %s completed", run.id)
 
             response = GraphRunResponse(
                 run_id=run.id,
-                final_state=run.state,
-                execution_log=run.execution_log,
+                final_state=dict(run.state),
+                execution_log=_log_names(graph, run.execution_log),
                 status=run.status,
             )
             return response
 
         except Exception as e:
             # mark run as failed and surface error
-            run.status = "failed"
-            run.error = str(e)
+            if log is not None:
+                del log[iter_count:]
+            _finish_run(run, e)
             logger.exception("Run %s failed: %s", run.id, e)
             response = GraphRunResponse(
                 run_id=run.id,
-                final_state=run.state,
-                execution_log=run.execution_log,
+                final_state=dict(run.state),
+                execution_log=_log_names(graph, run.execution_log),
                 status=run.status,
             )
             return response
 
+    async def run_graph_async(
+        self,
+        graph_id: str,
+        initial_state: Dict[str, Any],
+        max_iterations: int = 100,
+        max_parallel: int = 8,
+        reducer: Optional[Reducer] = None,
+        priority: RunPriority = "normal",
+    ) -> GraphRunResponse:
+        """
+        Run the graph from its entry_node, executing independent branches concurrently.
+
+        The engine keeps a frontier of ready nodes. When an edge fans out to several
+        nodes they run together via asyncio.gather (at most max_parallel at a time),
+        all reading the same immutable state, so no per-branch copy is made. The
+        updates the branches return are combined with `reducer` (default:
+        merge_updates) and applied to the state before the successors are
+        scheduled. A node reached by several branches waits until all of them
+        arrive and then runs once.
+
+        Nodes may be `async def`; plain nodes run in a thread (asyncio.to_thread) so the
+        event loop keeps serving other requests.
+        Raises EngineBusyError if `priority` is not admitted at the current memory level.
+        """
+
+        graph = self.get_graph(graph_id)
+        self._admit(priority)
+        return await self._execute_async(graph, initial_state, max_iterations, max_parallel, reducer)
+
+    async def run_batch_async(
+        self,
+        graph_id: str,
+        initial_states: List[Dict[str, Any]],
+        max_parallel: int = 8,
+        max_iterations: int = 100,
+        priority: RunPriority = "normal",
+    ) -> List[GraphRunResponse]:
+        """
+        Run the same graph once per initial state, at most max_parallel runs at a time.
+        The graph is looked up and the batch admitted once; each run executes as in
+        run_graph_async. Results are returned in the order of initial_states.
+        """
+        graph = self.get_graph(graph_id)
+        self._admit(priority)
+        semaphore = asyncio.Semaphore(max_parallel)
+
+        async def run_one(initial_state: Dict[str, Any]) -> GraphRunResponse:
+            async with semaphore:
+                return await self._execute_async(graph, initial_state, max_iterations)
+
+        return list(await asyncio.gather(*(run_one(s) for s in initial_states)))
+
+    async def _execute_async(
+        self,
+        graph: Graph,
+        initial_state: Dict[str, Any],
+        max_iterations: int = 100,
+        max_parallel: int = 8,
+        reducer: Optional[Reducer] = None,
+    ) -> GraphRunResponse:
+        # run_graph_async after lookup and admission; failures are recorded on the run
+        plan = graph._plan
+        reach = self._reachability[graph.id]
+        reducer = reducer or merge_updates
+        semaphore = asyncio.Semaphore(max_parallel)
+
+        run = self._new_run(graph.id, initial_state)
+
+        async def run_branch(cn: CompiledNode, base: StateMap) -> StateUpdate:
+            async with semaphore:
+                result = await _call_node(cn.fn, base)
+            return _branch_update(base, result, cn.name)
+
+        frontier: List[int] = [graph._name_to_idx[graph.entry_node]]
+        iter_count = 0
+
+        try:
+            if graph._driver is not None and graph._driver_depth <= max_iterations:
+                # no fan-out and no async nodes: one thread hop for the whole run instead of
+                # one per node. The run id is only handed out when this returns, so nothing
+                # reads the run while the thread updates it.
+                await asyncio.to_thread(graph._driver, run)
+                frontier = []
+
+            while frontier:
+                ready, deferred = _split_frontier(frontier, reach)
+                iter_count += len(ready)
+                if iter_count > max_iterations:
+                    raise EngineError(f"Max iterations ({max_iterations}) exceeded; possible infinite loop")
+
+                run.execution_log.extend(ready)
+
+                if len(ready) == 1:
+                    # single node: same contract as run_graph
+                    cn = plan[ready[0]]
+                    run.state = _apply_result(run.state, await _call_node(cn.fn, run.state), cn.name)
+                else:
+                    base = run.state
+                    updates = await asyncio.gather(*(run_branch(plan[i], base) for i in ready))
+                    run.state = _join_branches(base, list(updates), reducer)
+
+                successors: List[int] = []
+                for i in ready:
+                    successors.extend(_as_node_list(_next_index(plan[i], run.state)))
+                # a join node reached from several branches is scheduled once
+                frontier = list(dict.fromkeys(deferred + successors))
+
+            _finish_run(run)
+            logger.info("Run %s completed", run.id)
+
+        except Exception as e:
+            _finish_run(run, e)
+            logger.exception("Run %s failed: %s", run.id, e)
+
+        return GraphRunResponse(
+            run_id=run.id,
+            final_state=dict(run.state),
+            execution_log=_log_names(graph, run.execution_log),
+            status=run.status,
+        )
+
+    # -------------------------
+    # Worker pool (dispatcher + workers)
+    # -------------------------
+    async def start_workers(self, max_workers: int = 8) -> int:
+        """
+        Spawn the dispatcher and min(os.cpu_count(), max_workers) worker tasks
+        on the running event loop. Returns the number of workers.
+
+        Workers pull (run_id, node) items from a shared queue, execute the node
+        and report back to the dispatcher, which alone updates run.state,
+        resolves successors and enqueues them. Many runs progress at once and
+        parallel branches of one run overlap. Plain (CPU-bound) nodes run in a
+        thread, one per busy worker, so the worker count bounds them and the event
+        loop stays free; `async def` nodes are awaited in the background so a
+        worker never sits idle on I/O.
+        """
+        if self._tasks:
+            raise EngineError("Worker pool is already running")
+
+        num_workers = max(1, min(os.cpu_count() or 1, max_workers))
+        self._work_queue = asyncio.Queue()
+        self._completions = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._dispatcher())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(num_workers)]
+        logger.info("Worker pool started with %d workers", num_workers)
+        return num_workers
+
+    async def stop_workers(self) -> None:
+        """Cancel the dispatcher and workers; runs still in flight are marked failed."""
+        tasks = self._tasks + list(self._waiters)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._work_queue = None
+        self._completions = None
+
+        for run_id in list(self._active):
+            self._fail(self.runs[run_id], EngineError("Worker pool stopped"))
+
+    def submit_run(
+        self,
+        graph_id: str,
+        initial_state: Dict[str, Any],
+        max_iterations: int = 100,
+        priority: RunPriority = "normal",
+    ) -> Run:
+        """
+        Queue a run on the worker pool and return immediately.
+        Poll get_run() / get_run_state_response() for progress.
+        Raises EngineBusyError if `priority` is not admitted at the current memory level.
+        """
+        if self._work_queue is None:
+            raise EngineError("Worker pool is not running; call start_workers() first")
+
+        graph = self.get_graph(graph_id)
+        self._admit(priority)
+
+        run = self._new_run(graph.id, initial_state)
+        self._active[run.id] = _RunTask(graph=graph, max_iterations=max_iterations)
+
+        try:
+            self._schedule(run, [graph._name_to_idx[graph.entry_node]])
+        except Exception as e:
+            self._fail(run, e)
+        return run
+
+    def _schedule(self, run: Run, frontier: List[int]) -> None:
+        # enqueue the next layer of a run, or complete it when nothing is left
+        task = self._active[run.id]
+        if not frontier:
+            _finish_run(run)
+            del self._active[run.id]
+            logger.info("Run %s completed", run.id)
+            return
+
+        ready, deferred = _split_frontier(frontier, self._reachability[task.graph.id])
+        task.iter_count += len(ready)
+        if task.iter_count > task.max_iterations:
+            raise EngineError(f"Max iterations ({task.max_iterations}) exceeded; possible infinite loop")
+
+        plan = task.graph._plan
+        run.execution_log.extend(ready)
+        task.ready, task.deferred = ready, deferred
+        task.base = run.state
+        task.results = [None] * len(ready)
+        task.pending = len(ready)
+
+        for slot, idx in enumerate(ready):
+            # the state is immutable, so parallel branches share it without copies
+            self._work_queue.put_nowait((run.id, slot, plan[idx], run.state))
+
+    async def _worker(self) -> None:
+        while True:
+            run_id, slot, cn, state = await self._work_queue.get()
+            try:
+                if inspect.iscoroutinefunction(cn.fn):
+                    result = cn.fn(state)
+                else:
+                    # plain node: run it in a thread so the event loop keeps serving requests
+                    result = await asyncio.to_thread(cn.fn, state)
+                if inspect.isawaitable(result):
+                    # async (I/O-bound) node: finish it in the background so this worker stays busy
+                    waiter = asyncio.ensure_future(self._await_node(run_id, slot, result))
+                    self._waiters.add(waiter)
+                    waiter.add_done_callback(self._waiters.discard)
+                else:
+                    self._completions.put_nowait((run_id, slot, result, None))
+            except Exception as e:
+                self._completions.put_nowait((run_id, slot, None, e))
+            finally:
+                self._work_queue.task_done()
+
+    async def _await_node(self, run_id: RunId, slot: int, pending: Any) -> None:
+        try:
+            result = await pending
+            self._completions.put_nowait((run_id, slot, result, None))
+        except Exception as e:
+            self._completions.put_nowait((run_id, slot, None, e))
+
+    async def _dispatcher(self) -> None:
+        while True:
+            run_id, slot, result, error = await self._completions.get()
+            task = self._active.get(run_id)
+            if task is None:
+                # run already failed on another branch
+                continue
+
+            run = self.runs[run_id]
+            try:
+                if error is not None:
+                    raise error
+                task.results[slot] = result
+                task.pending -= 1
+                if task.pending:
+                    continue
+
+                plan = task.graph._plan
+                if len(task.results) == 1:
+                    run.state = _apply_result(run.state, task.results[0], plan[task.ready[0]].name)
+                else:
+                    updates = [
+                        _branch_update(task.base, r, plan[idx].name)
+                        for r, idx in zip(task.results, task.ready)
+                    ]
+                    run.state = _join_branches(task.base, updates, self.reducer)
+
+                successors: List[int] = []
+                for idx in task.ready:
+                    successors.extend(_as_node_list(_next_index(plan[idx], run.state)))
+                self._schedule(run, list(dict.fromkeys(task.deferred + successors)))
+            except Exception as e:
+                self._fail(run, e)
+
+    def _fail(self, run: Run, error: Exception) -> None:
+        _finish_run(run, error)
+        self._active.pop(run.id, None)
+        logger.error("Run %s failed: %s", run.id, error, exc_info=error)
+
+    def _new_run(self, graph_id: str, initial_state: Dict[str, Any]) -> Run:
+        """
+        Create and store a running Run, reusing an evicted Run object when one is pooled.
+        """
+        try:
+            run = self._run_pool.popleft()
+            # dataclass __init__ resets every field, including a fresh id
+            run.__init__(graph_id=graph_id, state=Map(initial_state), status="running")
+        except IndexError:
+            run = Run(graph_id=graph_id, state=Map(initial_state), status="running")
+
+        self.runs[run.id] = run
+        if len(self.runs) > self.max_runs:
+            self._evict_runs()
+        return run
+
+    def _evict_runs(self) -> None:
+        # drop least recently used finished runs until back under max_runs; runs still executing stay
+        excess = len(self.runs) - self.max_runs
+        evicted = []
+        for run_id, run in self.runs.items():
+            if excess <= 0:
+                break
+            if run.status in ("completed", "failed"):
+                evicted.append(run_id)
+                excess -= 1
+        for run_id in evicted:
+            run = self.runs.pop(run_id)
+            if isinstance(run.state, _OnDisk):
+                _remove_spill_file(run.state)
+            # release the state now rather than when the pooled object is reused
+            run.state = Map()
+            del run.execution_log[:]
+            self._run_pool.append(run)
+
+    # -------------------------
+    # Memory pressure
+    # -------------------------
+    async def start_memory_monitor(
+        self,
+        warning_bytes: Optional[int] = None,
+        critical_bytes: Optional[int] = None,
+        interval: float = 1.0,
+    ) -> None:
+        """
+        Start polling the process RSS every `interval` seconds.
+        Thresholds default to 70% (warning) and 85% (critical) of physical memory.
+        Relief is scheduled on the current event loop, alongside the dispatcher and
+        request handlers, so it never races them over run objects; one pass runs at a time.
+        """
+        if self._memory_monitor is not None:
+            raise EngineError("Memory monitor is already running")
+
+        total = psutil.virtual_memory().total
+        loop = asyncio.get_running_loop()
+
+        def on_pressure(level: MemoryLevel) -> None:
+            loop.call_soon_threadsafe(self._start_relief, level)
+
+        self._memory_monitor = _MemoryMonitor(
+            warning_bytes=warning_bytes or int(total * 0.70),
+            critical_bytes=critical_bytes or int(total * 0.85),
+            on_pressure=on_pressure,
+            interval=interval,
+        )
+        self._memory_monitor.start()
+
+    async def stop_memory_monitor(self) -> None:
+        """Stop the monitor, wait for a relief pass in progress and delete the spilled run states."""
+        if self._memory_monitor is not None:
+            self._memory_monitor.stop()
+            self._memory_monitor = None
+        if self._relief is not None:
+            await asyncio.gather(self._relief, return_exceptions=True)
+            self._relief = None
+        for run in self.runs.values():
+            if isinstance(run.state, _OnDisk):
+                run.state = Map()
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+    def _start_relief(self, level: MemoryLevel) -> None:
+        # called on the loop after every poll under pressure; skip while a pass is still writing
+        if self._relief is None or self._relief.done():
+            self._relief = asyncio.ensure_future(self.relieve_memory_pressure(level))
+
+    @property
+    def memory_level(self) -> MemoryLevel:
+        return self._memory_monitor.level if self._memory_monitor is not None else "normal"
+
+    def _admit(self, priority: RunPriority) -> None:
+        """
+        Admission control for new runs: at "warning" only low-priority runs are
+        refused, at "critical" everything but high-priority runs is.
+        """
+        level = self.memory_level
+        if (level == "critical" and priority != "high") or (level == "warning" and priority == "low"):
+            raise EngineBusyError("Memory pressure; retry later")
+
+    async def relieve_memory_pressure(self, level: MemoryLevel) -> int:
+        """
+        Spill the state of runs that finished more than spill_after seconds ago
+        to pickle files, keeping only their metadata in memory; get_run_state_response()
+        reloads it on demand. Under critical pressure also trims their execution_log
+        to the first and last 100 entries. Returns the number of runs spilled.
+
+        The runs are read and updated on the event loop; pickling and writing the
+        files happen in a thread.
+        """
+        cutoff = time.monotonic() - self.spill_after
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="workflow_runs_")
+
+        batch: List[Tuple[Run, StateMap, str]] = []
+        for run in self.runs.values():
+            if run.finished_at is None or run.finished_at > cutoff:
+                continue
+
+            if level == "critical" and len(run.execution_log) > 2 * _LOG_KEEP:
+                run.execution_log = run.execution_log[:_LOG_KEEP] + run.execution_log[-_LOG_KEEP:]
+
+            if isinstance(run.state, _OnDisk) or not run.state:
+                continue
+            batch.append((run, run.state, os.path.join(self.spill_dir, f"{run.id}.pkl")))
+
+        if not batch:
+            return 0
+        written = await asyncio.to_thread(_write_spill_files, [(state, path) for _, state, path in batch])
+
+        spilled = 0
+        for (run, state, path), ok in zip(batch, written):
+            if not ok:
+                continue
+            if run.state is state and self.runs.get(run.id) is run:
+                run.state = _OnDisk(path)
+                spilled += 1
+            else:
+                # evicted or recycled while the file was being written
+                _remove_spill_file(_OnDisk(path))
+
+        if spilled:
+            logger.info("Memory pressure (%s): spilled %d run states to %s", level, spilled, self.spill_dir)
+        return spilled
+
     def get_run(self, run_id: str) -> Run:
+        """
+        Look up a run and mark it recently used.
+        Run objects are recycled after eviction, so callers should not hold on to them.
+        """
         r = self.runs.get(run_id)
         if r is None:
             raise EngineError(f"Run not found: {run_id}")
+        self.runs.move_to_end(run_id)
         return r
 
     def get_run_state_response(self, run_id: str) -> RunStateResponse:
         run = self.get_run(run_id)
+        state = run.state
+        if isinstance(state, _OnDisk):
+            # spilled under memory pressure: read it back for this response only
+            state = _load_spill_file(state.path)
+        return self._run_state_response(run, state)
+
+    async def get_run_state_response_async(self, run_id: str) -> RunStateResponse:
+        """
+        get_run_state_response() for use on the event loop: a spilled state is
+        read back in a worker thread instead of blocking the loop.
+        """
+        run = self.get_run(run_id)
+        state = run.state
+        if not isinstance(state, _OnDisk):
+            return self._run_state_response(run, state)
+        # built before awaiting: the run may be evicted and its object recycled meanwhile
+        response = self._run_state_response(run, Map())
+        try:
+            state = await asyncio.to_thread(_load_spill_file, state.path)
+        except FileNotFoundError:
+            # evicted while loading
+            raise EngineError(f"Run not found: {run_id}")
+        response.state = dict(_public_state(state))
+        return response
+
+    def _run_state_response(self, run: Run, state: StateMap) -> RunStateResponse:
         return RunStateResponse(
             run_id=run.id,
             graph_id=run.graph_id,
             status=run.status,
-            state=run.state,
-            execution_log=run.execution_log,
+            state=dict(_public_state(state)),
+            execution_log=_log_names(self.get_graph(run.graph_id), run.execution_log),
             error=run.error
         )
 
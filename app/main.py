@@ -1,23 +1,57 @@
+from typing import Any
+
+import msgspec
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 
 import app.workflows.summarization
 
-from app.engine import engine, EngineError
+from app.engine import engine, EngineError, EngineBusyError
 from app.model import (
     GraphCreateRequest,
     GraphCreateResponse,
     GraphRunRequest,
-    GraphRunResponse,
-    RunStateResponse,
+    GraphRunAcceptedResponse,
+    BatchRunRequest,
+    GraphRunBatchResponse,
 )
 
+_json_encoder = msgspec.json.Encoder()
+
+# Retry-After (seconds) sent with 503 when a run is refused under memory pressure
+RETRY_AFTER_SECONDS = 5
+
+
+class MsgspecJSONResponse(JSONResponse):
+    """
+    JSON response rendered by msgspec's C encoder.
+    Handles plain dicts as well as the msgspec.Struct responses from app.model.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return _json_encoder.encode(content)
+
+
 app = FastAPI(
     title="Minimal Workflow Engine",
     description="A small LangGraph-style workflow engine built with FastAPI.",
     version="0.1.0",
+    default_response_class=MsgspecJSONResponse,
 )
 
 
+@app.on_event("startup")
+async def start_workers():
+    await engine.start_workers()
+    await engine.start_memory_monitor()
+
+
+@app.on_event("shutdown")
+async def stop_workers():
+    await engine.stop_workers()
+    await engine.stop_memory_monitor()
+
+
 @app.get("/")
 def root():
     return {"status": "ok", "message": "Workflow engine is running"}
@@ -41,36 +75,98 @@ def create_graph(payload: GraphCreateRequest):
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
 
 
-@app.post("/graph/run", response_model=GraphRunResponse)
-def run_graph(request: GraphRunRequest):
+@app.post("/graph/run", response_model=GraphRunAcceptedResponse, status_code=202)
+async def run_graph(request: GraphRunRequest):
     """
-    Run a previously created graph synchronously with an initial state.
+    Start a previously created graph with an initial state.
+
+    The run is queued on the engine's worker pool and this returns immediately.
+    Poll /graph/state/{run_id} until status is "completed" or "failed".
 
     Returns:
     - run_id
+    - status ("running", or "failed" if it could not be scheduled)
+
+    Under memory pressure the run may be refused with 503 and a Retry-After
+    header, depending on its priority ("low" / "normal" / "high").
+    """
+    try:
+        run = engine.submit_run(request.graph_id, request.initial_state, priority=request.priority)
+        return GraphRunAcceptedResponse(run_id=run.id, status=run.status)
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    except EngineError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
+
+
+@app.post("/graph/run_async", response_model=None)
+async def run_graph_async(request: GraphRunRequest):
+    """
+    Run a previously created graph, executing parallel branches concurrently.
+
+    Nodes listed together in an edge (e.g. "split_text": ["a", "b"]) run at
+    the same time and their state updates are merged before the join node.
+    Supports `async def` nodes. Waits for the run to finish and returns:
+    - run_id
     - final_state (after all nodes have executed)
     - execution_log (list of node names in order)
     - status ("completed" or "failed")
     """
     try:
-        result = engine.run_graph(request.graph_id, request.initial_state)
-        return result
+        result = await engine.run_graph_async(
+            request.graph_id, request.initial_state, priority=request.priority
+        )
+        return MsgspecJSONResponse(result)
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    except EngineError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
+
+
+@app.post("/graph/run_batch", response_model=None)
+async def run_graph_batch(request: BatchRunRequest):
+    """
+    Run a previously created graph once per initial state.
+
+    The graph is looked up once for the whole batch and at most `max_parallel`
+    runs execute at the same time (runs overlap while awaiting `async def` nodes).
+    Waits for every run and returns:
+    - results (one run_graph_async-style result per initial state, in request order)
+    """
+    try:
+        results = await engine.run_batch_async(
+            request.graph_id,
+            request.initial_states,
+            max_parallel=request.max_parallel,
+            priority=request.priority,
+        )
+        return MsgspecJSONResponse(GraphRunBatchResponse(results=results))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
     except EngineError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
 
 
-@app.get("/graph/state/{run_id}", response_model=RunStateResponse)
-def get_run_state(run_id: str):
+@app.get("/graph/state/{run_id}", response_model=None)
+async def get_run_state(run_id: str):
     """
     Get the current state of a workflow run.
 
-    In this basic implementation, runs are synchronous and in-memory,
-    so this usually returns the final state immediately.
+    Runs started via /graph/run execute in the background, so this returns
+    the state so far while status is "running" and the final state afterwards.
+    Served on the event loop so it never reads a state the dispatcher is updating;
+    a state spilled to disk under memory pressure is read back in a worker thread.
     """
     try:
-        return engine.get_run_state_response(run_id)
+        # encoded in one pass by msgspec when the response is built, so an
+        # unencodable value surfaces here as a 500
+        return MsgspecJSONResponse(await engine.get_run_state_response_async(run_id))
     except EngineError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -1,17 +1,60 @@
-from typing import Any, Dict, List, Optional, Literal
+from typing import Any, Callable, Dict, List, Optional, Literal, Union
+from array import array
+from dataclasses import dataclass, field
 from datetime import datetime
-from uuid import uuid4
+import itertools
+import os
 
+import msgspec
+from immutables import Map
 from pydantic import BaseModel, Field
 
 
 # ---- Core type aliases ----
 
-State = Dict[str, Any]          # Shared state that flows between nodes
+State = Dict[str, Any]          # Shared state as sent to / returned by the API
+StateMap = Map                  # Shared state that flows between nodes (persistent, immutable)
+StateUpdate = Dict[str, Any]    # Keys a node changed; merged into the StateMap by the engine
 NodeName = str                  # String alias for clarity
 GraphId = str
 RunId = str
 
+# An edge target: a single next node, several nodes to run in parallel, or null to stop
+Successors = Union[NodeName, List[NodeName], None]
+
+
+# ---- Id generation ----
+# Ids are a per-process prefix plus a counter, so creating a graph/run needs no
+# os.urandom call. The prefix (pid + a random salt drawn once) keeps ids unique
+# across worker processes and restarts.
+
+def _new_id_prefix() -> str:
+    return f"{os.getpid():x}{os.urandom(4).hex()}"
+
+
+_id_prefix = _new_id_prefix()
+_graph_counter = itertools.count()
+_run_counter = itertools.count()
+
+
+def _reset_ids_after_fork() -> None:
+    # a forked worker must not continue the parent's id sequence
+    global _id_prefix, _graph_counter, _run_counter
+    _id_prefix = _new_id_prefix()
+    _graph_counter = itertools.count()
+    _run_counter = itertools.count()
+
+
+os.register_at_fork(after_in_child=_reset_ids_after_fork)
+
+
+def _new_graph_id() -> GraphId:
+    return f"graph_{_id_prefix}_{next(_graph_counter):x}"
+
+
+def _new_run_id() -> RunId:
+    return f"run_{_id_prefix}_{next(_run_counter):x}"
+
 
 # ---- Graph definition models ----
 
@@ -24,33 +67,41 @@ class GraphCreateRequest(BaseModel):
     entry_node: NodeName = Field(..., description="Name of the starting node")
     nodes: List[NodeName] = Field(..., description="List of node names used in this graph")
 
-    # Linear edges: node -> next node (or null to stop)
-    edges: Dict[NodeName, Optional[NodeName]] = Field(
+    # Linear edges: node -> next node, list of parallel nodes (fan-out), or null to stop
+    edges: Dict[NodeName, Successors] = Field(
         ...,
-        description="Mapping of node -> next node for normal transitions",
+        description="Mapping of node -> next node (or list of nodes to run in parallel) for normal transitions",
         example={"split_text": "generate_summaries"},
     )
 
     # Conditional edges: node -> {condition_key -> next node or null}
     # e.g. "check_length": {"too_long": "refine_summary", "ok": null}
-    conditional_edges: Optional[Dict[NodeName, Dict[str, Optional[NodeName]]]] = Field(
+    conditional_edges: Optional[Dict[NodeName, Dict[str, Successors]]] = Field(
         default_factory=dict,
         description="Optional mapping for branching/looping based on state-derived conditions",
     )
 
 
-class Graph(BaseModel):
+@dataclass(slots=True, kw_only=True)
+class Graph:
     """
     Internal representation of a stored graph.
+    Plain dataclass: it is only built by the engine from an already validated request.
     """
-    id: GraphId = Field(default_factory=lambda: f"graph_{uuid4().hex}")
+    id: GraphId = field(default_factory=_new_graph_id)
     name: str
     entry_node: NodeName
     nodes: List[NodeName]
-    edges: Dict[NodeName, Optional[NodeName]]
-    conditional_edges: Dict[NodeName, Dict[str, Optional[NodeName]]] = Field(
-        default_factory=dict
-    )
+    edges: Dict[NodeName, Successors]
+    conditional_edges: Dict[NodeName, Dict[str, Successors]] = field(default_factory=dict)
+
+    # dispatch plan filled in by the engine at create time (see app.engine._compile_graph)
+    _plan: List[Any] = field(default_factory=list, init=False, repr=False, compare=False)
+    _name_to_idx: Dict[NodeName, int] = field(default_factory=dict, init=False, repr=False, compare=False)
+    # straight-line driver generated for small acyclic graphs (see app.engine._generate_driver);
+    # usable when max_iterations >= _driver_depth
+    _driver: Optional[Callable[[Any], None]] = field(default=None, init=False, repr=False, compare=False)
+    _driver_depth: int = field(default=0, init=False, repr=False, compare=False)
 
 
 class GraphCreateResponse(BaseModel):
@@ -65,6 +116,11 @@ class GraphCreateResponse(BaseModel):
 RunStatus = Literal["pending", "running", "completed", "failed"]
 
 
+# Admission priority: under memory pressure the engine rejects "low" runs first,
+# and only accepts "high" runs once pressure is critical.
+RunPriority = Literal["low", "normal", "high"]
+
+
 class GraphRunRequest(BaseModel):
     """
     Payload expected by POST /graph/run.
@@ -74,27 +130,75 @@ class GraphRunRequest(BaseModel):
         default_factory=dict,
         description="Initial shared state passed to the workflow",
     )
+    priority: RunPriority = Field(
+        default="normal",
+        description="Admission priority used when the server is under memory pressure",
+    )
+
+
+# Upper bounds for one POST /graph/run_batch request
+MAX_BATCH_SIZE = 1000
+MAX_BATCH_PARALLEL = 32
+
+
+class BatchRunRequest(BaseModel):
+    """
+    Payload expected by POST /graph/run_batch.
+    Runs the same graph once per initial state.
+    """
+    graph_id: GraphId
+    initial_states: List[State] = Field(
+        ...,
+        max_length=MAX_BATCH_SIZE,
+        description="One initial state per run",
+    )
+    max_parallel: int = Field(
+        default=8,
+        ge=1,
+        le=MAX_BATCH_PARALLEL,
+        description="Maximum number of runs of the batch executing at the same time",
+    )
+    priority: RunPriority = Field(
+        default="normal",
+        description="Admission priority used when the server is under memory pressure",
+    )
 
 
-class Run(BaseModel):
+@dataclass(slots=True, kw_only=True)
+class Run:
     """
     Internal representation of a single execution of a graph.
     Useful for async / long-running workflows.
+    Plain dataclass: updated on every node, never validated.
     """
-    id: RunId = Field(default_factory=lambda: f"run_{uuid4().hex}")
+    id: RunId = field(default_factory=_new_run_id)
     graph_id: GraphId
     status: RunStatus = "pending"
 
-    state: State = Field(default_factory=dict)
-    execution_log: List[NodeName] = Field(default_factory=list)
+    # replaced by an engine placeholder while spilled to disk under memory pressure
+    state: StateMap = field(default_factory=Map)
+    # plan indices (graph._plan) of the executed nodes, as uint16; names are
+    # looked up only when a response is built
+    execution_log: "array[int]" = field(default_factory=lambda: array("H"))
 
     error: Optional[str] = None
+    finished_at: Optional[float] = None   # time.monotonic() when the run completed/failed
 
 
-class GraphRunResponse(BaseModel):
+class GraphRunAcceptedResponse(BaseModel):
     """
     Response returned by POST /graph/run.
-    For simplicity assuming synchronous runs that complete in a single request.
+    The run executes in the background; poll GET /graph/state/{run_id}.
+    """
+    run_id: RunId
+    status: RunStatus
+
+
+class GraphRunResponse(msgspec.Struct):
+    """
+    Response returned by POST /graph/run_async.
+    The run has finished by the time the request returns.
+    msgspec Struct: encoded straight to JSON by MsgspecJSONResponse, no validation.
     """
     run_id: RunId
     final_state: State
@@ -102,9 +206,18 @@ class GraphRunResponse(BaseModel):
     status: RunStatus
 
 
-class RunStateResponse(BaseModel):
+class GraphRunBatchResponse(msgspec.Struct):
+    """
+    Response returned by POST /graph/run_batch: one result per initial state, in request order.
+    msgspec Struct: encoded straight to JSON by MsgspecJSONResponse, no validation.
+    """
+    results: List[GraphRunResponse]
+
+
+class RunStateResponse(msgspec.Struct):
     """
     Response returned by GET /graph/state/{run_id}.
+    msgspec Struct: encoded straight to JSON by MsgspecJSONResponse, no validation.
     """
     run_id: RunId
     graph_id: GraphId
@@ -1,6 +1,6 @@
 # app/registry.py
 
-from typing import Callable, Dict, Any
+from typing import Callable, Dict, Any, Set
 
 
 # ---------------------------------------------------------
@@ -11,6 +11,10 @@ NODE_REGISTRY: Dict[str, Callable[[dict], dict]] = {}
 # Simple registry for tools (helper functions)
 TOOL_REGISTRY: Dict[str, Callable[..., Any]] = {}
 
+# State keys nodes use as private caches; the engine drops them from finished runs
+# and never returns them to clients
+PRIVATE_STATE_KEYS: Set[str] = set()
+
 
 # ---------------------------------------------------------
 # NODE REGISTRATION DECORATOR
@@ -18,13 +22,15 @@ TOOL_REGISTRY: Dict[str, Callable[..., Any]] = {}
 def register(name: str):
     """
     Decorator to register a Python function as a node in the workflow engine.
+    Nodes receive the immutable state mapping and return a dict with only
+    the keys they changed (or None). They may also be `async def`.
     
     Usage:
 
     @register("split_text")
     def split_text_node(state):
         ...
-        return state
+        return {"chunks": chunks}
     """
     def decorator(func: Callable[[dict], dict]):
         if name in NODE_REGISTRY:
@@ -36,6 +42,14 @@ def register(name: str):
     return decorator
 
 
+def register_private_keys(*keys: str) -> None:
+    """
+    Declare state keys that nodes use as private caches (e.g. a tokenized input).
+    They are dropped when a run finishes and are not returned by the API.
+    """
+    PRIVATE_STATE_KEYS.update(keys)
+
+
 # ---------------------------------------------------------
 # TOOL REGISTRATION
 # ---------------------------------------------------------
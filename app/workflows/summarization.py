@@ -4,18 +4,26 @@ Rule-based summarization workflow nodes.
 
 Nodes register themselves using the `@register` decorator from app.registry.
 They follow the contract expected by the engine:
-- Accept a dict-like `state`
-- Mutate and/or return the state
+- Accept the (immutable, read-only) `state` mapping
+- Return a dict with only the keys they changed; the engine merges it into the state
 - For conditional nodes, set state[node_name] to a value the engine will read
-  (e.g., state["decide_pipeline"] = "short" or "long",
-         state["check_length"] = True / False)
+  (e.g., return {"decide_pipeline": "short"} or {"check_length": True})
+- The "__words__", "__chunks_src__" and "__refine_words__" keys are private caches
+  shared between nodes (registered with register_private_keys); the engine drops
+  them when the run finishes
 """
 
-from typing import Dict, List
-from app.registry import register
+import re
+from typing import Any, Dict, List, Mapping, Tuple
+from app.registry import register, register_private_keys
+
+register_private_keys("__words__", "__chunks_src__", "__refine_words__")
 
 # --- Helper utilities ---
 
+# a word as str.split() sees it (\s matches exactly the characters str.isspace() accepts)
+_WORD = re.compile(r"\S+")
+
 
 def _words(text: str) -> List[str]:
     if not text:
@@ -23,16 +31,86 @@ def _words(text: str) -> List[str]:
     return text.split()
 
 
+def _ensure_words(state: Mapping[str, Any], update: Dict) -> List[str]:
+    """
+    Tokenize state["original_text"] once and reuse the word list across nodes.
+    Memoized as state["__words__"] = (text, words); recomputed only if the text changes,
+    in which case the new cache entry is added to the node's `update`.
+    """
+    text = state.get("original_text", "") or ""
+    cached = state.get("__words__")
+    if cached is not None and cached[0] == text:
+        return cached[1]
+    words = _words(text)
+    update["__words__"] = (text, words)
+    return words
+
+
+def _summary_words(state: Mapping[str, Any], update: Dict) -> Tuple[List[str], int]:
+    """
+    Word list of state["final_summary"] for the refine loop, as (words, n) where the
+    summary is words[:n]. Memoized as state["__refine_words__"] = (summary, words, n):
+    refine_summary stores the trimmed summary against the same list with a smaller n,
+    so neither it nor check_length re-splits the summary on later iterations.
+    """
+    summary = state.get("final_summary", "") or ""
+    cached = state.get("__refine_words__")
+    if cached is not None and cached[0] == summary:
+        return cached[1], cached[2]
+    words = _words(summary)
+    update["__refine_words__"] = (summary, words, len(words))
+    return words, len(words)
+
+
+def _chunk_and_summarize_py(words: List[str], chunk_size: int, summary_words: int) -> List[str]:
+    # first `summary_words` words of every `chunk_size`-word chunk, joined per chunk
+    if not words:
+        return []
+    keep = min(chunk_size, summary_words)
+    return [" ".join(words[i : i + keep]) for i in range(0, len(words), chunk_size)]
+
+
+try:
+    # compiled version of the same loop, built with `cythonize -i app/_fast.pyx`
+    from app._fast import chunk_and_summarize
+except ImportError:
+    chunk_and_summarize = _chunk_and_summarize_py
+
+
+def _chunk_offsets(text: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    (start, end) offsets into `text` of every `chunk_size`-word chunk, from one
+    regex pass over the text. text[start:end] spans the chunk's first to last word.
+    """
+    offsets: List[Tuple[int, int]] = []
+    if chunk_size <= 0:
+        # like split_text, a text without words yields no chunks whatever the chunk size
+        if chunk_size == 0 and _WORD.search(text) is not None:
+            raise ValueError("chunk_size must not be zero")
+        return offsets
+    start = end = 0
+    for i, m in enumerate(_WORD.finditer(text)):
+        if i % chunk_size == 0:
+            if i:
+                offsets.append((start, end))
+            start = m.start()
+        end = m.end()
+    if end:
+        offsets.append((start, end))
+    return offsets
+
+
 def _sentences(text: str) -> List[str]:
     # Naive sentence split by period.
-    return [s.strip() for s in text.split(".") if s.strip()]
+    # map/filter keep the whole pass in C and strip each piece only once.
+    return list(filter(None, map(str.strip, text.split("."))))
 
 
 # --- Nodes ---
 
 
 @register("decide_pipeline")
-def decide_pipeline(state: Dict) -> Dict:
+def decide_pipeline(state: Mapping[str, Any]) -> Dict:
     """
     Decide whether to run the short single-pass pipeline or the full pipeline.
     Sets state["decide_pipeline"] to "short" or "long".
@@ -41,22 +119,21 @@ def decide_pipeline(state: Dict) -> Dict:
     - If original_text word count <= short_threshold -> "short"
     - Else -> "long"
     """
-    text = state.get("original_text", "") or ""
     short_threshold = int(state.get("short_threshold", 100))  # words
 
-    wc = len(_words(text))
-    state["decide_pipeline"] = "short" if wc <= short_threshold else "long"
-    return state
+    update: Dict = {}
+    wc = len(_ensure_words(state, update))
+    update["decide_pipeline"] = "short" if wc <= short_threshold else "long"
+    return update
 
 
 @register("single_pass_summary")
-def single_pass_summary(state: Dict) -> Dict:
+def single_pass_summary(state: Mapping[str, Any]) -> Dict:
     """
     Simple one-pass summarizer for short inputs.
     Rule: keep up to `single_pass_words` words (or `max_length` if provided and smaller).
     Produces state["final_summary"].
     """
-    text = state.get("original_text", "") or ""
     default_keep = int(state.get("single_pass_words", 80))
     max_len = state.get("max_length")  # optional maximum words for final summary
 
@@ -64,70 +141,117 @@ def single_pass_summary(state: Dict) -> Dict:
     if isinstance(max_len, int):
         keep = min(keep, max_len)
 
-    words = _words(text)
+    update: Dict = {}
+    words = _ensure_words(state, update)
     summary_words = words[:keep]
-    state["final_summary"] = " ".join(summary_words).strip()
+    update["final_summary"] = " ".join(summary_words).strip()
     # iteration counter (useful for logs / safeguards)
-    state.setdefault("iteration", 0)
-    return state
+    if "iteration" not in state:
+        update["iteration"] = 0
+    return update
 
 
 @register("split_text")
-def split_text(state: Dict) -> Dict:
+def split_text(state: Mapping[str, Any]) -> Dict:
     """
     Split the original_text into word-based chunks.
     - chunk_size: number of words per chunk (default 100)
     Writes state["chunks"] -> List[str]
+
+    With state["use_chunk_offsets"] set, writes state["chunks_offsets"] ->
+    List[(start, end)] into original_text instead, so no chunk strings are built.
     """
-    text = state.get("original_text", "") or ""
-    words = _words(text)
+    if state.get("use_chunk_offsets"):
+        text = state.get("original_text", "") or ""
+        return {"chunks_offsets": _chunk_offsets(text, int(state.get("chunk_size", 100)))}
+
+    update: Dict = {}
+    words = _ensure_words(state, update)
     chunk_size = int(state.get("chunk_size", 100))
 
     if not words:
-        state["chunks"] = []
-        return state
-
-    chunks = []
-    for i in range(0, len(words), chunk_size):
-        chunk = " ".join(words[i : i + chunk_size])
-        chunks.append(chunk)
-    state["chunks"] = chunks
-    return state
+        chunks = []
+    else:
+        chunks = [" ".join(words[i : i + chunk_size]) for i in range(0, len(words), chunk_size)]
+    update["chunks"] = chunks
+    # remember the words behind these chunks so generate_summaries can slice them instead of re-splitting
+    update["__chunks_src__"] = (chunks, words, chunk_size)
+    return update
 
 
 @register("generate_summaries")
-def generate_summaries(state: Dict) -> Dict:
+def generate_summaries(state: Mapping[str, Any]) -> Dict:
     """
     Produce a simple extractive summary for each chunk.
     Rule: For each chunk, keep first `chunk_summary_words` words.
+    Reads state["chunks"], or state["chunks_offsets"] when split_text produced offsets.
     Writes state["chunk_summaries"] -> List[str]
     """
-    chunks: List[str] = state.get("chunks", []) or []
     chunk_summary_words = int(state.get("chunk_summary_words", 30))
 
-    summaries = []
-    for c in chunks:
-        words = _words(c)
-        summary = " ".join(words[:chunk_summary_words]).strip()
-        summaries.append(summary)
-    state["chunk_summaries"] = summaries
-    return state
+    offsets = state.get("chunks_offsets")
+    if offsets is not None and "chunks" not in state:
+        # split at most chunk_summary_words times: only the kept words of each span are tokenized
+        text = state.get("original_text", "") or ""
+        k = chunk_summary_words
+        return {"chunk_summaries": [" ".join(text[s:e].split(None, k)[:k]) for s, e in offsets]}
+
+    chunks: List[str] = state.get("chunks", []) or []
+
+    src = state.get("__chunks_src__")
+    if src is not None and src[0] is chunks and chunk_summary_words >= 0:
+        # chunks came from split_text: take each chunk's leading words straight from the word list
+        _, words, chunk_size = src
+        summaries = chunk_and_summarize(words, chunk_size, chunk_summary_words)
+    else:
+        summaries = [" ".join(_words(c)[:chunk_summary_words]).strip() for c in chunks]
+    return {"chunk_summaries": summaries}
 
 
 @register("merge_summaries")
-def merge_summaries(state: Dict) -> Dict:
+def merge_summaries(state: Mapping[str, Any]) -> Dict:
     """
     Merge chunk summaries into a single `final_summary`.
     Simple concatenation with a space between chunk summaries.
     """
     chunk_summaries: List[str] = state.get("chunk_summaries", []) or []
     merged = " ".join(s for s in chunk_summaries if s).strip()
-    state["final_summary"] = merged
-    return state
+    return {"final_summary": merged}
+
+
+@register("summarize_chunks")
+def summarize_chunks(state: Mapping[str, Any]) -> Dict:
+    """
+    Fused split_text -> generate_summaries -> merge_summaries.
+    Same final_summary as the three-node chain, but each chunk's leading
+    `chunk_summary_words` words are taken straight from the word list, so no
+    chunk strings or per-chunk summaries are materialized.
+    - chunk_size: number of words per chunk (default 100)
+    - chunk_summary_words: words kept per chunk (default 30)
+    Writes state["final_summary"].
+    """
+    update: Dict = {}
+    words = _ensure_words(state, update)
+    chunk_size = int(state.get("chunk_size", 100))
+    chunk_summary_words = int(state.get("chunk_summary_words", 30))
+
+    if not words:
+        summaries = []
+    elif chunk_summary_words >= 0:
+        summaries = chunk_and_summarize(words, chunk_size, chunk_summary_words)
+    else:
+        # a negative count drops words from the end of each chunk, as generate_summaries does
+        summaries = [
+            " ".join(words[i : i + chunk_size][:chunk_summary_words])
+            for i in range(0, len(words), chunk_size)
+        ]
+    # like merge_summaries, empty chunk summaries are skipped
+    update["final_summary"] = " ".join(s for s in summaries if s)
+    return update
 
 
 @register("refine_summary")
-def refine_summary(state: Dict) -> Dict:
+def refine_summary(state: Mapping[str, Any]) -> Dict:
     """
     Refine the current final_summary by trimming it.
     Strategy (rule-based):
@@ -138,13 +262,14 @@ def refine_summary(state: Dict) -> Dict:
         * This ensures each iteration reduces size and the loop converges.
     Writes back to state["final_summary"] and increments state["iteration"].
     """
+    # iteration counter starts at 0 even when there is nothing to refine
+    no_change: Dict = {} if "iteration" in state else {"iteration": 0}
+
     summary = state.get("final_summary", "") or ""
     if not summary:
-        state.setdefault("iteration", 0)
-        return state
+        return no_change
 
-    words = _words(summary)
-    current_len = len(words)
+    words, current_len = _summary_words(state, no_change)
     max_len = state.get("max_length")  # desired target length in words (optional)
 
     # If no max_len specified, use a conservative default (e.g., 150 words)
@@ -153,8 +278,7 @@ def refine_summary(state: Dict) -> Dict:
 
     if current_len <= max_len:
         # nothing to do
-        state.setdefault("iteration", 0)
-        return state
+        return no_change
 
     # reduce multiplicatively to ensure convergence
     reduction_factor = float(state.get("refine_factor", 0.7))  # keep 70% by default
@@ -168,27 +292,28 @@ def refine_summary(state: Dict) -> Dict:
             new_len = int(max_len)
 
     new_summary = " ".join(words[:new_len]).strip()
-    state["final_summary"] = new_summary
 
-    # increment iteration counter
-    state["iteration"] = int(state.get("iteration", 0)) + 1
-    return state
+    # increment iteration counter; the trimmed summary is words[:new_len], so keep the same list
+    return {
+        "final_summary": new_summary,
+        "iteration": int(state.get("iteration", 0)) + 1,
+        "__refine_words__": (new_summary, words, new_len),
+    }
 
 
 @register("check_length")
-def check_length(state: Dict) -> Dict:
+def check_length(state: Mapping[str, Any]) -> Dict:
     """
     Check if final_summary is longer than max_length.
     Sets state["check_length"] to True if it is too long (engine will loop),
     or False if it's within limits (engine will stop).
     """
-    summary = state.get("final_summary", "") or ""
     max_len = state.get("max_length")
     if max_len is None:
         # If no max specified, treat as ok (no loop)
-        state["check_length"] = False
-        return state
+        return {"check_length": False}
 
-    current_len = len(_words(summary))
-    state["check_length"] = current_len > int(max_len)
-    return state
+    update: Dict = {}
+    _, current_len = _summary_words(state, update)
+    update["check_length"] = current_len > int(max_len)
+    return update
@@ -0,0 +1,78 @@
+# Test configuration. Kept at the repository root so pytest puts it on sys.path
+# and `app` is importable when running plain `pytest`.
+import asyncio
+import time
+
+import pytest
+
+from app.engine import WorkflowEngine
+from app.model import GraphCreateRequest
+
+
+async def wait_for_runs(runs, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while any(r.status == "running" for r in runs):
+        assert time.monotonic() < deadline, "runs did not finish"
+        await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+def fan_out():
+    """
+    Factory for a fan-out/join graph: start -> [a, <branch>], a -> join, <branch> -> b2 -> join.
+    "a" reaches the join in one step and the other branch in two. Returns (engine, graph).
+    """
+    def start(s):
+        return {"xs": []}
+
+    def a(s):
+        return {"xs": ["a"], "a": 1}
+
+    def b1(s):
+        return {"xs": ["b1"]}
+
+    def b2(s):
+        return {"b": 2}
+
+    def join(s):
+        return {"joined": list(s["xs"]), "seen": (s.get("a"), s.get("b")), "joins": s.get("joins", 0) + 1}
+
+    def build(branch="b1", **extra_nodes):
+        engine = WorkflowEngine(dict(start=start, a=a, b1=b1, b2=b2, join=join, **extra_nodes))
+        graph = engine.create_graph(GraphCreateRequest(
+            name="fan", entry_node="start", nodes=["start", "a", branch, "b2", "join"],
+            edges={"start": ["a", branch], "a": "join", branch: "b2", "b2": "join"},
+        ))
+        return engine, graph
+
+    return build
+
+
+async def _run_on_pool(engine, graph_id, state, **kwargs):
+    await engine.start_workers()
+    try:
+        run = engine.submit_run(graph_id, state, **kwargs)
+        await wait_for_runs([run])
+        response = engine.get_run_state_response(run.id)
+        return response.status, response.execution_log, response.state, run.error
+    finally:
+        await engine.stop_workers()
+
+
+async def _run_async(engine, graph_id, state, **kwargs):
+    response = await engine.run_graph_async(graph_id, state, **kwargs)
+    return response.status, response.execution_log, response.final_state, engine.runs[response.run_id].error
+
+
+@pytest.fixture(params=["run_graph_async", "worker_pool"])
+def execute(request):
+    """
+    Run a graph to completion on one of the executors that support parallel branches.
+    Returns (status, execution_log, state, error).
+    """
+    runner = _run_async if request.param == "run_graph_async" else _run_on_pool
+
+    def run(engine, graph, state=None, **kwargs):
+        return asyncio.run(runner(engine, graph.id, state or {}, **kwargs))
+
+    return run
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app.engine import WorkflowEngine
+from app.main import app
+from app.model import MAX_BATCH_PARALLEL, MAX_BATCH_SIZE, GraphCreateRequest
+
+
+def test_batch_runs_sync_nodes_off_the_event_loop():
+    def slow(s):
+        time.sleep(0.3)
+        return {"out": s["i"]}
+
+    async def main():
+        engine = WorkflowEngine({"slow": slow})
+        graph = engine.create_graph(GraphCreateRequest(name="s", entry_node="slow", nodes=["slow"], edges={}))
+        batch = asyncio.ensure_future(engine.run_batch_async(graph.id, [{"i": i} for i in range(6)], max_parallel=6))
+        ticks = 0
+        while not batch.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return batch.result(), ticks
+
+    start = time.perf_counter()
+    results, ticks = asyncio.run(main())
+    assert [r.final_state["out"] for r in results] == list(range(6))
+    assert all(r.status == "completed" for r in results)
+    assert ticks >= 10  # the loop kept running while the nodes slept
+    assert time.perf_counter() - start < 1.5  # not 6 x 0.3s back to back
+
+
+def test_batch_request_bounds():
+    def post(**payload):
+        return client.post("/graph/run_batch", json={"graph_id": "g", "initial_states": [{}], **payload})
+
+    with TestClient(app) as client:
+        too_many = post(initial_states=[{}] * (MAX_BATCH_SIZE + 1))
+        too_parallel = post(max_parallel=MAX_BATCH_PARALLEL + 1)
+        unknown_graph = post()
+    assert too_many.status_code == 422
+    assert too_parallel.status_code == 422
+    assert unknown_graph.status_code == 400
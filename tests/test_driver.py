@@ -0,0 +1,130 @@
+import asyncio
+import random
+import time
+
+from immutables import Map
+
+from app.engine import WorkflowEngine
+from app.model import GraphCreateRequest
+
+
+def _node(i):
+    # small deterministic node exercising every result type and conditional value
+    def fn(state):
+        r = (state.get("x", 0) * 31 + i) % 7
+        if r == 0:
+            return None
+        if r == 1:
+            return Map(state).set("m", i)
+        if r == 2 and state.get("boom") == i:
+            raise ValueError("boom")
+        return {"x": state.get("x", 0) + i, f"n{i}": r % 3 == 0, "c": ["a", "b", "c", None, True][r % 5]}
+    return fn
+
+
+def _random_graph(rng, engine, n):
+    nodes = [f"n{i}" for i in range(n)]
+    edges, cond = {}, {}
+    for i, name in enumerate(nodes):
+        later = nodes[i + 1:]
+        if not later or rng.random() < 0.15:
+            continue
+        if rng.random() < 0.4:
+            keys = rng.sample(["true", "false", "a", "b", "1", "default"], rng.randint(1, 4))
+            cond[name] = {k: rng.choice(later + [None]) for k in keys}
+        else:
+            edges[name] = rng.choice(later)
+    return engine.create_graph(GraphCreateRequest(
+        name="random", entry_node=nodes[0], nodes=nodes, edges=edges, conditional_edges=cond,
+    ))
+
+
+def _run(engine, graph, state, max_iterations):
+    response = engine.run_graph(graph.id, dict(state), max_iterations=max_iterations)
+    run = engine.runs[response.run_id]
+    return response.status, response.execution_log, response.final_state, run.error
+
+
+def test_driver_matches_loop_on_random_graphs():
+    rng = random.Random(3)
+    engine = WorkflowEngine({f"n{i}": _node(i) for i in range(10)})
+    used = 0
+    for _ in range(200):
+        graph = _random_graph(rng, engine, rng.randint(1, 10))
+        driver = graph._driver
+        for x in range(4):
+            for max_iterations in (100, 3):
+                state = {"x": x, "boom": rng.randint(0, 9)}
+                with_driver = _run(engine, graph, state, max_iterations)
+                graph._driver = None
+                with_loop = _run(engine, graph, state, max_iterations)
+                graph._driver = driver
+                assert with_driver == with_loop
+                used += driver is not None and graph._driver_depth <= max_iterations
+    assert used > 0
+
+
+def test_run_graph_async_uses_driver_and_matches_loop():
+    rng = random.Random(5)
+    engine = WorkflowEngine({f"n{i}": _node(i) for i in range(10)})
+    calls = []
+
+    def run_async(graph, state):
+        response = asyncio.run(engine.run_graph_async(graph.id, dict(state), max_iterations=100))
+        return response.status, response.execution_log, response.final_state, engine.runs[response.run_id].error
+
+    for _ in range(50):
+        graph = _random_graph(rng, engine, rng.randint(1, 10))
+        driver = graph._driver
+        if driver is None:
+            continue
+        state = {"x": rng.randint(0, 3), "boom": rng.randint(0, 9)}
+        graph._driver = lambda run: calls.append(run) or driver(run)
+        with_driver = run_async(graph, state)
+        graph._driver = None
+        with_loop = run_async(graph, state)
+        assert with_driver == with_loop
+    assert calls
+
+
+def test_graph_with_async_node_has_no_driver():
+    async def fetch(s):
+        return {"fetched": True}
+
+    engine = WorkflowEngine({"start": lambda s: {}, "fetch": fetch})
+    graph = engine.create_graph(GraphCreateRequest(
+        name="io", entry_node="start", nodes=["start", "fetch"], edges={"start": "fetch"},
+    ))
+    assert graph._driver is None
+    assert asyncio.run(engine.run_graph_async(graph.id, {})).final_state == {"fetched": True}
+
+
+def test_long_chain_is_created_without_driver():
+    names = [f"n{i}" for i in range(2000)]
+    engine = WorkflowEngine({name: (lambda s: {"k": s.get("k", 0) + 1}) for name in names})
+    graph = engine.create_graph(GraphCreateRequest(
+        name="chain", entry_node="n0", nodes=names, edges=dict(zip(names, names[1:])),
+    ))
+    assert graph._driver is None
+
+    response = engine.run_graph(graph.id, {}, max_iterations=5000)
+    assert response.status == "completed"
+    assert response.final_state["k"] == 2000
+
+
+def test_wide_conditional_dag_gives_up_quickly():
+    # 12 layers of 4-way conditionals: 4**12 paths if every one were expanded
+    layers = [[f"l{d}_{j}" for j in range(4)] for d in range(12)]
+    nodes = [name for layer in layers for name in layer] + ["end"]
+    conditional_edges = {}
+    for layer, following in zip(layers, layers[1:] + [["end"] * 4]):
+        for name in layer:
+            conditional_edges[name] = {str(j): target for j, target in enumerate(following)}
+    engine = WorkflowEngine({name: (lambda s: {}) for name in nodes})
+
+    start = time.perf_counter()
+    graph = engine.create_graph(GraphCreateRequest(
+        name="wide", entry_node="l0_0", nodes=nodes, edges={}, conditional_edges=conditional_edges,
+    ))
+    assert time.perf_counter() - start < 1.0
+    assert graph._driver is None
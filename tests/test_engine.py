@@ -0,0 +1,35 @@
+import app.workflows.summarization  # noqa: F401  (registers the summarization nodes)
+from app.engine import WorkflowEngine, engine
+from app.model import GraphCreateRequest
+
+
+def _summarization_graph():
+    return engine.create_graph(GraphCreateRequest(
+        name="summarize", entry_node="decide_pipeline",
+        nodes=["decide_pipeline", "single_pass_summary", "split_text", "generate_summaries",
+               "merge_summaries", "refine_summary", "check_length"],
+        edges={"single_pass_summary": "refine_summary", "split_text": "generate_summaries",
+               "generate_summaries": "merge_summaries", "merge_summaries": "refine_summary",
+               "refine_summary": "check_length"},
+        conditional_edges={"decide_pipeline": {"short": "single_pass_summary", "long": "split_text"},
+                           "check_length": {"true": "refine_summary", "false": None}},
+    ))
+
+
+def test_private_caches_dropped_but_client_keys_kept():
+    graph = _summarization_graph()
+    text = " ".join(f"w{i}." for i in range(300))
+    response = engine.run_graph(graph.id, {"original_text": text, "max_length": 20, "__client__": 1})
+
+    assert response.status == "completed"
+    assert response.final_state["__client__"] == 1
+    assert not {"__words__", "__chunks_src__", "__refine_words__"} & set(response.final_state)
+    assert engine.get_run_state_response(response.run_id).state["__client__"] == 1
+
+
+def test_non_str_state_keys():
+    e = WorkflowEngine({"n": lambda s: {1: "x"}})
+    graph = e.create_graph(GraphCreateRequest(name="k", entry_node="n", nodes=["n"], edges={}))
+    response = e.run_graph(graph.id, {})
+    assert response.status == "completed"
+    assert response.final_state[1] == "x"
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import stat
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.engine import EngineBusyError, WorkflowEngine, _MemoryMonitor, _OnDisk, engine as app_engine
+from app.main import app
+from app.model import GraphCreateRequest
+from app.registry import register
+
+
+@register("test_pressure_noop")
+def _noop(state):
+    return None
+
+
+def _engine_with_finished_runs(n):
+    engine = WorkflowEngine({"fill": lambda s: {"data": "x" * 1000, "i": s["i"]}})
+    graph = engine.create_graph(GraphCreateRequest(name="f", entry_node="fill", nodes=["fill"], edges={}))
+    run_ids = [engine.run_graph(graph.id, {"i": i}).run_id for i in range(n)]
+    engine.spill_after = 0.0
+    return engine, run_ids
+
+
+def test_spill_uses_private_directory_and_reloads_state():
+    async def main():
+        engine, run_ids = _engine_with_finished_runs(3)
+        spilled = await engine.relieve_memory_pressure("warning")
+        spill_dir = engine.spill_dir
+
+        assert spilled == 3
+        assert stat.S_IMODE(os.stat(spill_dir).st_mode) == 0o700
+        assert all(isinstance(engine.runs[r].state, _OnDisk) for r in run_ids)
+        assert engine.get_run_state_response(run_ids[1]).state["i"] == 1
+
+        await engine.stop_memory_monitor()
+        assert engine.spill_dir is None
+        assert not os.path.exists(spill_dir)
+
+    asyncio.run(main())
+
+
+def test_spill_skips_runs_replaced_while_writing():
+    async def main():
+        engine, run_ids = _engine_with_finished_runs(2)
+        relief = asyncio.ensure_future(engine.relieve_memory_pressure("warning"))
+        await asyncio.sleep(0)  # runs were snapshotted; files are being written in a thread
+        engine.runs.pop(run_ids[0])
+        spilled = await relief
+
+        assert spilled == 1
+        assert os.listdir(engine.spill_dir) == [f"{run_ids[1]}.pkl"]
+        await engine.stop_memory_monitor()
+
+    asyncio.run(main())
+
+
+def test_async_state_response_reads_spilled_state_off_loop():
+    async def main():
+        engine, run_ids = _engine_with_finished_runs(2)
+        await engine.relieve_memory_pressure("warning")
+
+        response = await engine.get_run_state_response_async(run_ids[1])
+        assert response.state["i"] == 1
+        assert response == engine.get_run_state_response(run_ids[1])
+        await engine.stop_memory_monitor()
+
+    asyncio.run(main())
+
+
+def test_failed_spill_leaves_no_partial_file():
+    async def main():
+        engine, run_ids = _engine_with_finished_runs(2)
+        # the lambda is written after "data", so pickling fails part-way through the file
+        engine.runs[run_ids[0]].state = engine.runs[run_ids[0]].state.set("zz", lambda: None)
+        spilled = await engine.relieve_memory_pressure("warning")
+
+        assert spilled == 1
+        assert not isinstance(engine.runs[run_ids[0]].state, _OnDisk)
+        assert os.listdir(engine.spill_dir) == [f"{run_ids[1]}.pkl"]
+        await engine.stop_memory_monitor()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("level,priority,admitted", [
+    ("normal", "low", True), ("normal", "normal", True), ("normal", "high", True),
+    ("warning", "low", False), ("warning", "normal", True), ("warning", "high", True),
+    ("critical", "low", False), ("critical", "normal", False), ("critical", "high", True),
+])
+def test_admission_by_priority_and_memory_level(level, priority, admitted):
+    engine, _ = _engine_with_finished_runs(0)
+    engine._memory_monitor = _MemoryMonitor(0, 0, on_pressure=lambda level: None)
+    engine._memory_monitor.level = level
+    graph_id = next(iter(engine.graphs))
+
+    if admitted:
+        engine._admit(priority)
+        assert asyncio.run(engine.run_graph_async(graph_id, {"i": 0}, priority=priority)).status == "completed"
+    else:
+        with pytest.raises(EngineBusyError):
+            engine._admit(priority)
+        with pytest.raises(EngineBusyError):
+            asyncio.run(engine.run_graph_async(graph_id, {"i": 0}, priority=priority))
+        assert not engine.runs
+
+
+def test_run_refused_with_retry_after_under_critical_pressure(monkeypatch):
+    graph = app_engine.create_graph(GraphCreateRequest(
+        name="n", entry_node="test_pressure_noop", nodes=["test_pressure_noop"], edges={},
+    ))
+    with TestClient(app) as client:
+        # the startup hook started the monitor; keep its next poll from resetting the forced level
+        monkeypatch.setattr(app_engine._memory_monitor, "critical_bytes", 0)
+        monkeypatch.setattr(app_engine._memory_monitor, "level", "critical")
+        body = {"graph_id": graph.id, "initial_state": {}}
+
+        refused = client.post("/graph/run", json=body)
+        assert refused.status_code == 503
+        assert refused.headers["Retry-After"] == "5"
+        assert client.post("/graph/run", json={**body, "priority": "high"}).status_code == 202
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from app.engine import WorkflowEngine
+from app.model import GraphCreateRequest
+
+
+def test_join_waits_for_uneven_branches(fan_out, execute):
+    status, log, state, error = execute(*fan_out())
+
+    assert status == "completed"
+    assert log == ["start", "a", "b1", "b2", "join"]
+    assert state["joins"] == 1
+    assert state["seen"] == (1, 2)
+    # list updates of parallel branches are concatenated by merge_updates
+    assert state["joined"] == ["a", "b1"]
+
+
+def test_failing_branch_fails_run_without_merging(fan_out, execute):
+    def boom(s):
+        raise ValueError("branch failed")
+
+    status, log, state, error = execute(*fan_out(branch="boom", boom=boom))
+
+    assert status == "failed"
+    assert error == "branch failed"
+    assert state == {"xs": []}
+    assert "join" not in log
+
+
+def test_max_iterations_fails_before_merge(fan_out, execute):
+    # start + two branches = 3 nodes; the next layer would exceed the limit
+    status, log, state, error = execute(*fan_out(), max_iterations=3)
+
+    assert status == "failed"
+    assert "Max iterations (3) exceeded" in error
+    assert log == ["start", "a", "b1"]
+    assert "joined" not in state
+
+
+def test_custom_reducer(fan_out):
+    def last_writer_wins(merged, update):
+        return {**merged, **update}
+
+    engine, graph = fan_out()
+    response = asyncio.run(engine.run_graph_async(graph.id, {}, reducer=last_writer_wins))
+    assert response.final_state["joined"] == ["b1"]
+
+
+def test_async_branches_overlap():
+    async def slow(s):
+        await asyncio.sleep(0.2)
+        return {"xs": ["slow"]}
+
+    engine = WorkflowEngine({"start": lambda s: {"xs": []}, "s1": slow, "s2": slow, "s3": slow})
+    graph = engine.create_graph(GraphCreateRequest(
+        name="io", entry_node="start", nodes=["start", "s1", "s2", "s3"], edges={"start": ["s1", "s2", "s3"]},
+    ))
+    start = time.perf_counter()
+    response = asyncio.run(engine.run_graph_async(graph.id, {}))
+
+    assert response.status == "completed"
+    assert response.final_state["xs"] == ["slow"] * 3
+    assert time.perf_counter() - start < 0.5
+
+
+def test_reachability_only_computed_for_shared_frontiers(fan_out):
+    names = [f"n{i}" for i in range(3000)]
+    engine = WorkflowEngine({name: (lambda s: None) for name in names})
+    graph = engine.create_graph(GraphCreateRequest(
+        name="chain", entry_node="n0", nodes=names, edges=dict(zip(names, names[1:])),
+    ))
+    assert not engine._reachability[graph.id]._sets
+
+    fan, fan_graph = fan_out()
+    asyncio.run(fan.run_graph_async(fan_graph.id, {}))
+    # only members of multi-node frontiers ({a, b1}, then {join, b2}) were looked up
+    plan_idx = fan_graph._name_to_idx
+    assert set(fan._reachability[fan_graph.id]._sets) == {plan_idx[n] for n in ("a", "b1", "b2", "join")}
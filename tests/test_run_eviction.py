@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+from fastapi.testclient import TestClient
+
+from app.engine import WorkflowEngine, _OnDisk, engine
+from app.main import app
+from app.model import GraphCreateRequest
+from app.registry import register
+
+
+@register("test_evict_echo")
+def _echo(state):
+    return {"seen": state["i"]}
+
+
+def _engine(max_runs):
+    local = WorkflowEngine({"test_evict_echo": _echo}, max_runs=max_runs)
+    graph = local.create_graph(GraphCreateRequest(
+        name="e", entry_node="test_evict_echo", nodes=["test_evict_echo"], edges={},
+    ))
+    return local, graph
+
+
+def test_get_run_refreshes_eviction_order():
+    local, graph = _engine(max_runs=3)
+    ids = [local.run_graph(graph.id, {"i": i}).run_id for i in range(3)]
+    local.get_run(ids[0])  # now most recently used; ids[1] is the oldest
+    local.run_graph(graph.id, {"i": 3})
+
+    assert ids[0] in local.runs
+    assert ids[1] not in local.runs
+    assert ids[2] in local.runs
+
+
+def test_running_runs_are_never_evicted():
+    local, graph = _engine(max_runs=2)
+    running = [local._new_run(graph.id, {}) for _ in range(2)]
+    finished = local.run_graph(graph.id, {"i": 0}).run_id
+    local.run_graph(graph.id, {"i": 1})
+
+    # over the cap, but only finished runs can go
+    assert all(r.id in local.runs for r in running)
+    assert finished not in local.runs
+    assert len(local.runs) == 3
+
+
+def test_evicted_run_is_not_found(monkeypatch):
+    graph = engine.create_graph(GraphCreateRequest(
+        name="e", entry_node="test_evict_echo", nodes=["test_evict_echo"], edges={},
+    ))
+    with TestClient(app) as client:
+        first = engine.run_graph(graph.id, {"i": 0}).run_id
+        monkeypatch.setattr(engine, "max_runs", 1)
+        second = engine.run_graph(graph.id, {"i": 1}).run_id
+
+        assert client.get(f"/graph/state/{first}").status_code == 404
+        assert client.get(f"/graph/state/{second}").json()["state"]["seen"] == 1
+
+
+def test_recycled_run_starts_fresh():
+    local, graph = _engine(max_runs=1)
+    old = local.run_graph(graph.id, {"i": 0}).run_id
+    old_run = local.runs[old]
+    local.run_graph(graph.id, {"i": 1})
+    assert list(local._run_pool) == [old_run]
+
+    run = local._new_run(graph.id, {"i": 2})
+    assert run is old_run
+    assert run.id != old
+    assert run.status == "running"
+    assert dict(run.state) == {"i": 2}
+    assert len(run.execution_log) == 0
+    assert run.error is None
+
+
+def test_eviction_removes_spill_file():
+    async def main():
+        local, graph = _engine(max_runs=2)
+        ids = [local.run_graph(graph.id, {"i": i}).run_id for i in range(2)]
+        local.spill_after = 0.0
+        await local.relieve_memory_pressure("warning")
+        path = local.runs[ids[0]].state.path
+        assert isinstance(local.runs[ids[1]].state, _OnDisk)
+
+        local.run_graph(graph.id, {"i": 2})
+        assert ids[0] not in local.runs
+        assert not os.path.exists(path)
+        await local.stop_memory_monitor()
+
+    asyncio.run(main())
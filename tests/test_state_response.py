@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+
+from app.engine import engine
+from app.main import _json_encoder, app
+from app.model import GraphCreateRequest
+from app.registry import register
+
+
+@register("test_state_fill")
+def _fill(state):
+    return {"big": ["w"] * state["size"], "n": state["size"], 1: "x"}
+
+
+@register("test_state_unencodable")
+def _unencodable(state):
+    return {"bad": object()}
+
+
+def _run(node, state):
+    graph = engine.create_graph(GraphCreateRequest(name="t", entry_node=node, nodes=[node], edges={}))
+    return engine.run_graph(graph.id, state).run_id
+
+
+def test_state_body_matches_single_shot_encoding():
+    with TestClient(app) as client:
+        for size in (10, 100_000):
+            run_id = _run("test_state_fill", {"size": size})
+            body = client.get(f"/graph/state/{run_id}")
+            assert body.status_code == 200
+            assert body.content == _json_encoder.encode(engine.get_run_state_response(run_id))
+            state = body.json()["state"]
+            assert state["n"] == size
+            assert state["1"] == "x"  # non-str keys are written as JSON strings
+
+
+def test_unencodable_state_is_an_error():
+    with TestClient(app) as client:
+        run_id = _run("test_state_unencodable", {})
+        assert client.get(f"/graph/state/{run_id}").status_code == 500
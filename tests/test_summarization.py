@@ -0,0 +1,43 @@
+import itertools
+
+import pytest
+from immutables import Map
+
+from app.workflows.summarization import generate_summaries, merge_summaries, split_text, summarize_chunks
+
+
+def _chain(state):
+    # split_text -> generate_summaries -> merge_summaries, as the engine would apply them
+    for node in (split_text, generate_summaries, merge_summaries):
+        state = state.update(node(state))
+    return state["final_summary"]
+
+
+TEXTS = ["", "one", "a bb  ccc.\n dd! x " * 7, " ".join(f"w{i}" for i in range(250))]
+
+
+@pytest.mark.parametrize(
+    "text,chunk_size,chunk_summary_words",
+    itertools.product(TEXTS, [-3, 1, 7, 100], [-2, 0, 1, 3, 200]),
+)
+def test_summarize_chunks_matches_three_node_chain(text, chunk_size, chunk_summary_words):
+    state = Map(original_text=text, chunk_size=chunk_size, chunk_summary_words=chunk_summary_words)
+    assert summarize_chunks(state)["final_summary"] == _chain(state)
+
+
+@pytest.mark.parametrize("text", [t for t in TEXTS if t])
+def test_summarize_chunks_rejects_zero_chunk_size_like_chain(text):
+    state = Map(original_text=text, chunk_size=0, chunk_summary_words=3)
+    with pytest.raises(ValueError):
+        _chain(state)
+    with pytest.raises(ValueError):
+        summarize_chunks(state)
+
+
+@pytest.mark.parametrize("text", ["", "  \n "])
+@pytest.mark.parametrize("chunk_summary_words", [-2, 3])
+def test_empty_text_gives_no_chunks_for_any_chunk_size(text, chunk_summary_words):
+    state = Map(original_text=text, chunk_size=0, chunk_summary_words=chunk_summary_words)
+    assert split_text(state)["chunks"] == []
+    assert split_text(state.set("use_chunk_offsets", True))["chunks_offsets"] == []
+    assert _chain(state) == summarize_chunks(state)["final_summary"] == ""
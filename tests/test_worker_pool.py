@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from conftest import wait_for_runs
+
+from app.engine import WorkflowEngine
+from app.model import GraphCreateRequest
+
+
+def test_plain_nodes_do_not_block_event_loop():
+    def slow(s):
+        time.sleep(0.3)
+        return {"done": True}
+
+    async def main():
+        engine = WorkflowEngine({"slow": slow})
+        workers = await engine.start_workers(max_workers=4)
+        try:
+            graph = engine.create_graph(GraphCreateRequest(name="s", entry_node="slow", nodes=["slow"], edges={}))
+            runs = [engine.submit_run(graph.id, {}) for _ in range(workers)]
+            # the loop must keep ticking while the nodes sleep in their threads
+            ticks = 0
+            while any(r.status == "running" for r in runs):
+                await asyncio.sleep(0.01)
+                ticks += 1
+        finally:
+            await engine.stop_workers()
+        assert all(r.status == "completed" for r in runs)
+        assert ticks >= 10
+
+    asyncio.run(main())
+
+
+def test_many_runs_complete(fan_out):
+    async def main():
+        engine, graph = fan_out()
+        await engine.start_workers()
+        try:
+            runs = [engine.submit_run(graph.id, {}) for _ in range(20)]
+            await wait_for_runs(runs)
+        finally:
+            await engine.stop_workers()
+        assert all(r.status == "completed" and r.state["joins"] == 1 for r in runs)
+        assert not engine._active
+
+    asyncio.run(main())
+
+
+def test_stop_workers_fails_runs_in_flight():
+    async def slow(s):
+        await asyncio.sleep(10)
+
+    async def main():
+        engine = WorkflowEngine({"slow": slow})
+        await engine.start_workers()
+        graph = engine.create_graph(GraphCreateRequest(name="s", entry_node="slow", nodes=["slow"], edges={}))
+        run = engine.submit_run(graph.id, {})
+        await asyncio.sleep(0.05)
+        await engine.stop_workers()
+        assert run.status == "failed"
+        assert run.error == "Worker pool stopped"
+        assert not engine._waiters
+
+    asyncio.run(main())